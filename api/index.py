@@ -1,22 +1,59 @@
+import asyncio
 import os
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse
+import re
+from collections import OrderedDict
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import HTMLResponse, ORJSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 import google.generativeai as genai
+import orjson
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # --- PATH CONFIGURATION (CRITICAL FOR VERCEL) ---
-# This finds the 'templates' folder one level up from this 'api' folder
-current_dir = os.path.dirname(os.path.realpath(__file__))
+# This finds the 'templates' folder one level up from this 'api' folder.
+# __file__ is already absolute under Vercel/uvicorn, so realpath's extra
+# stat of every path component is skipped on cold start.
+current_dir = os.path.dirname(__file__)
 parent_dir = os.path.dirname(current_dir)
 templates = Jinja2Templates(directory=os.path.join(parent_dir, "templates"))
 
 # --- API KEY SETUP ---
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
 if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
+    # Pin the async gRPC transport so every request shares one long-lived
+    # HTTP/2 channel instead of paying TCP+TLS setup per call.
+    genai.configure(api_key=GOOGLE_API_KEY, transport="grpc_asyncio")
+
+# --- RESPONSE CACHE ---
+# Repeat queries for the same topic are answered from memory instead of
+# paying for another multi-second Gemini round-trip.
+EXPLAIN_CACHE_MAXSIZE = int(os.environ.get("EXPLAIN_CACHE_MAXSIZE", "1024"))
+_explain_cache = OrderedDict()
+
+# --- MICRO-BATCHING ---
+# Topics arriving within a short window are folded into one multi-topic
+# Gemini call, so the RPC overhead is paid once per batch instead of once
+# per request under burst load.
+EXPLAIN_MAX_BATCH = int(os.environ.get("EXPLAIN_MAX_BATCH", "8"))
+EXPLAIN_BATCH_WINDOW = float(os.environ.get("EXPLAIN_BATCH_WINDOW", "0.03"))
+# Upper bound on how long a request waits for the whole pipeline (batching
+# window + semaphore queueing + the Gemini call itself); a stalled pipeline
+# surfaces as an error instead of hanging the request forever.
+EXPLAIN_TIMEOUT = float(os.environ.get("EXPLAIN_TIMEOUT", "60"))
+_batch_queue: asyncio.Queue = asyncio.Queue()
+
+# --- SINGLE-FLIGHT ---
+# Simultaneous requests for the same topic share one in-flight future, so a
+# thundering herd on a cold cache entry costs one Gemini call, not N.
+_inflight = {}
+
+# --- UPSTREAM CONCURRENCY LIMIT ---
+# The event loop will happily fire thousands of simultaneous Gemini calls,
+# which only earns 429s and slow retries; cap in-flight calls to stay under
+# the project's quota.
+GEMINI_SEM = asyncio.Semaphore(int(os.environ.get("GEMINI_CONCURRENCY", "32")))
 
 # --- DATA MODELS ---
 class TopicRequest(BaseModel):
@@ -44,35 +81,218 @@ Your output must be raw JSON with keys: what_it_is, human_connection, social_inf
 Do not use Markdown formatting in the JSON.
 """
 
+# Build the model once at import time; constructing it per request re-runs
+# client setup and auth lookup on every call for no benefit. Note that
+# gemini-pro (1.0) rejects system_instruction, so the system prompt is
+# prepended to the user prompt via the precomputed prefix below instead.
+MODEL = genai.GenerativeModel('gemini-pro') if GOOGLE_API_KEY else None
+
+# The constant prompt pieces are assembled once here so the handler only
+# concatenates the topic itself.
+_PROMPT_PREFIX = SYSTEM_PROMPT + "\n\nUSER TOPIC: "
+_PROMPT_SUFFIX = "\n\nRespond in JSON."
+
+BATCH_INSTRUCTIONS = """
+You will receive several user topics at once. Answer each one independently,
+following all of the rules above. Your output must be a raw JSON list with
+one object per topic, in the same order as the topics.
+"""
+
+_BATCH_PREFIX = SYSTEM_PROMPT + "\n" + BATCH_INSTRUCTIONS + "\nTopics:\n"
+
+# Strips the markdown code fences Gemini sometimes wraps around its JSON in
+# one pass instead of three chained str.replace scans.
+_FENCE_RE = re.compile(r"^```(?:json)?\n?|\n?```$")
+
+def _clean_response_text(text):
+    return _FENCE_RE.sub("", text.strip()).strip()
+
+def _format_error(text_response):
+    return {
+        "what_it_is": "Error parsing AI response.",
+        "human_connection": text_response,
+        "social_influence": "",
+        "relevant_studies": "",
+        "confidence_level": "Low",
+        "confidence_reason": "Format error"
+    }
+
+def _cache_put(topic, data):
+    _explain_cache[topic.strip().lower()] = data
+    if len(_explain_cache) > EXPLAIN_CACHE_MAXSIZE:
+        _explain_cache.popitem(last=False)
+
+async def _explain_single(topic):
+    full_prompt = _PROMPT_PREFIX + topic + _PROMPT_SUFFIX
+    async with GEMINI_SEM:
+        response = await asyncio.wait_for(
+            MODEL.generate_content_async(full_prompt), timeout=30
+        )
+    text_response = _clean_response_text(response.text)
+
+    try:
+        data = orjson.loads(text_response)
+    except orjson.JSONDecodeError:
+        return _format_error(text_response)
+    _cache_put(topic, data)
+    return data
+
+async def _explain_batch(topics):
+    numbered = "\n".join(f"{i + 1}. {topic}" for i, topic in enumerate(topics))
+    full_prompt = _BATCH_PREFIX + numbered + _PROMPT_SUFFIX
+    async with GEMINI_SEM:
+        response = await asyncio.wait_for(
+            MODEL.generate_content_async(full_prompt), timeout=30
+        )
+    text_response = _clean_response_text(response.text)
+
+    try:
+        results = orjson.loads(text_response)
+        if not isinstance(results, list) or len(results) != len(topics):
+            raise ValueError("batch answer count does not match topic count")
+        if not all(isinstance(result, dict) for result in results):
+            # A right-length list of strings or nulls must not reach clients
+            # or the cache; only real answer objects count as a clean parse.
+            raise ValueError("batch answers are not all objects")
+    except ValueError:
+        # Covers orjson.JSONDecodeError as well as a wrongly shaped list.
+        # The multi-topic format is best-effort; if the model does not
+        # produce a well-shaped list, fall back to one call per topic
+        # instead of handing every caller a format error.
+        return list(await asyncio.gather(*(_explain_single(topic) for topic in topics)))
+
+    for topic, data in zip(topics, results):
+        _cache_put(topic, data)
+    return results
+
+async def _dispatch(items):
+    try:
+        if len(items) == 1:
+            results = [await _explain_single(items[0][0])]
+        else:
+            results = await _explain_batch([topic for topic, _ in items])
+    except Exception as e:
+        for _, future in items:
+            if not future.done():
+                future.set_exception(e)
+        return
+
+    for (_, future), data in zip(items, results):
+        if not future.done():
+            future.set_result(data)
+
+# asyncio only keeps weak references to running tasks, so dispatch tasks are
+# parked here until they finish.
+_dispatch_tasks = set()
+
+async def _batcher():
+    while True:
+        items = [await _batch_queue.get()]
+        deadline = asyncio.get_running_loop().time() + EXPLAIN_BATCH_WINDOW
+        while len(items) < EXPLAIN_MAX_BATCH:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(_batch_queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        # Dispatch without awaiting so the loop goes straight back to
+        # draining the queue and batches overlap in flight; GEMINI_SEM is
+        # the actual bound on upstream concurrency.
+        task = asyncio.create_task(_dispatch(items))
+        _dispatch_tasks.add(task)
+        task.add_done_callback(_dispatch_tasks.discard)
+
+# Module-level reference so the batcher task cannot be garbage-collected
+# mid-run (asyncio holds only a weak reference to running tasks).
+_batcher_task = None
+
+def _ensure_batcher():
+    # Vercel's Python runtime does not reliably run ASGI lifespan events, so
+    # the handler lazy-starts the batcher rather than depending on startup.
+    global _batcher_task
+    if _batcher_task is None or _batcher_task.done():
+        _batcher_task = asyncio.create_task(_batcher())
+
+@app.on_event("startup")
+async def _start_batcher():
+    _ensure_batcher()
+
+# The landing page takes no dynamic context, so it is rendered once per
+# process and served as plain HTML bytes afterwards.
+_index_html = None
+
 @app.get("/", response_class=HTMLResponse)
-async def read_root(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+async def read_root():
+    global _index_html
+    if _index_html is None:
+        _index_html = templates.get_template("index.html").render({})
+    return HTMLResponse(
+        _index_html,
+        headers={"Cache-Control": "public, max-age=3600, s-maxage=86400"},
+    )
 
-@app.post("/explain")
+# response_model=None plus returning ORJSONResponse directly skips FastAPI's
+# jsonable_encoder walk over a dict that already came from parsed JSON.
+@app.post("/explain", response_class=ORJSONResponse, response_model=None)
 async def explain_topic(request: TopicRequest):
-    if not GOOGLE_API_KEY:
-        raise HTTPException(status_code=500, detail="API Key not configured.")
+    if MODEL is None:
+        raise HTTPException(status_code=503, detail="API Key not configured.")
 
-    try:
-        model = genai.GenerativeModel('gemini-pro')
-        full_prompt = f"{SYSTEM_PROMPT}\n\nUSER TOPIC: {request.topic}\n\nRespond in JSON."
-        
-        response = model.generate_content(full_prompt)
-        text_response = response.text.replace('```json', '').replace('```', '').strip()
-        
-        import json
+    cache_key = request.topic.strip().lower()
+    cached = _explain_cache.get(cache_key)
+    if cached is not None:
+        _explain_cache.move_to_end(cache_key)
+        return ORJSONResponse(cached)
+
+    existing = _inflight.get(cache_key)
+    if existing is not None:
         try:
-            data = json.loads(text_response)
-            return data
-        except json.JSONDecodeError:
-            return {
-                "what_it_is": "Error parsing AI response.",
-                "human_connection": text_response,
-                "social_influence": "",
-                "relevant_studies": "",
-                "confidence_level": "Low",
-                "confidence_reason": "Format error"
-            }
+            return ORJSONResponse(await asyncio.wait_for(asyncio.shield(existing), EXPLAIN_TIMEOUT))
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Upstream request timed out.")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
+    _ensure_batcher()
+    future = asyncio.get_running_loop().create_future()
+    _inflight[cache_key] = future
+    try:
+        await _batch_queue.put((request.topic, future))
+        # shield keeps the shared future alive for other single-flight
+        # waiters if this particular request times out or is cancelled.
+        return ORJSONResponse(await asyncio.wait_for(asyncio.shield(future), EXPLAIN_TIMEOUT))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Upstream request timed out.")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        _inflight.pop(cache_key, None)
+
+# Streaming variant: pushes the model output as server-sent events while it
+# is being generated, so the first byte reaches the client in hundreds of
+# milliseconds instead of after the full generation. The frontend assembles
+# the JSON from the deltas. Streaming bypasses the topic cache and batcher,
+# which only deal in complete responses.
+@app.post("/explain/stream", response_model=None)
+async def explain_topic_stream(request: TopicRequest):
+    if MODEL is None:
+        raise HTTPException(status_code=503, detail="API Key not configured.")
+
+    full_prompt = _PROMPT_PREFIX + request.topic + _PROMPT_SUFFIX
+
+    async def _gen():
+        try:
+            async with GEMINI_SEM:
+                stream = await MODEL.generate_content_async(full_prompt, stream=True)
+                async for chunk in stream:
+                    yield b"data: " + orjson.dumps({"delta": chunk.text}) + b"\n\n"
+        except Exception as e:
+            # The status line is already sent, so errors travel as an event.
+            yield b"data: " + orjson.dumps({"error": str(e)}) + b"\n\n"
+            return
+        yield b"data: [DONE]\n\n"
+
+    return StreamingResponse(_gen(), media_type="text/event-stream")
@@ -1 +1,24 @@
-
+import os
+
+import uvicorn
+
+# --- SELF-HOSTED ENTRYPOINT ---
+# Vercel serves api/index.py directly and ignores this file; run
+# `python main.py` for local or self-hosted deployments.
+if __name__ == "__main__":
+    port = int(os.environ.get("PORT", "8000"))
+    # A single worker pins the app to one core; size the pool to the host by
+    # default and let deployments override via WEB_CONCURRENCY.
+    # The app must be passed as an import string for workers > 1.
+    workers = int(os.environ.get("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2 + 1))
+    # uvloop and httptools replace the default asyncio loop and h11 parser;
+    # for an app that spends nearly all its time awaiting Gemini I/O this is
+    # the cheapest throughput win available.
+    uvicorn.run(
+        "api.index:app",
+        host="0.0.0.0",
+        port=port,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+    )